@@ -19,20 +19,42 @@ CC Proxy Detector v5.2 - Claude Code 中转来源检测工具
   usage 字段        snake_case            camelCase / 改写     snake_case
 """
 import argparse
+import functools
+import hashlib
+import http.cookiejar
 import json
 import os
 import re
 import sys
+import threading
 import time
 import concurrent.futures
-from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from typing import Final, Optional, Sequence
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except ImportError:
     print("需要 requests: pip install requests")
     sys.exit(1)
 
+# 可选: orjson 加速探测请求/响应的 JSON 编解码, 未安装时回退标准库
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+else:
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
 
 # ── 指纹常量 ──────────────────────────────────────────────
 
@@ -44,27 +66,41 @@ KIRO_MODEL_PREFIX = "kiro-"
 
 # Anthropic 原生 msg id: msg_ + base62 (无连字符, 如 msg_01PzoexiYoH5j9X4TZWfkx5q)
 # Antigravity 伪造:      msg_ + UUID (有连字符, 可能截断, 如 msg_5a4e4f0a-d67d-4424-a1dc-)
-# 关键区别: base62 不含连字符, UUID 含连字符
-MSG_ID_UUID_PATTERN = re.compile(
-    r"^msg_[0-9a-f]{8}-[0-9a-f]{4}-",
-    re.IGNORECASE,
-)
+# 关键区别: base62 不含连字符, UUID 含连字符 (只需检查固定位置, 无需正则)
+UUID_DASH_POSITIONS = (8, 13, 18, 23)  # 8-4-4-4-12
+# Google Vertex AI 简化 tool id: tool_0, tool_1, ...
+TOOL_N_PATTERN = re.compile(r"^tool_\d+$")
 
 # thinking signature 长度阈值
 THINKING_SIG_SHORT_THRESHOLD = 100  # Antigravity 签名通常 < 100
 
 AWS_HEADER_KEYWORDS = ("x-amzn", "x-amz-", "bedrock")
 ANTHROPIC_HEADER_KEYWORDS = ("anthropic-ratelimit", "x-ratelimit", "retry-after")
+# 关键词合并为单个正则, 每个 header key 只扫描一遍
+AWS_HEADER_RE = re.compile("|".join(map(re.escape, AWS_HEADER_KEYWORDS)))
+ANTHROPIC_HEADER_RE = re.compile("|".join(map(re.escape, ANTHROPIC_HEADER_KEYWORDS)))
+
+# 中转平台 header key 特征 (命名分组 -> 平台)
+PROXY_PLATFORM_KEY_RE = re.compile(
+    r"(?P<aidistri>aidistri)|(?P<openrouter>openrouter)|(?P<oneapi>one-api|new-api)"
+)
+
+# ratelimit header (小写) -> (Fingerprint 字段, 转换函数)
+RATELIMIT_HEADER_FIELDS = {
+    "anthropic-ratelimit-input-tokens-limit": ("ratelimit_input_limit", int),
+    "anthropic-ratelimit-input-tokens-remaining": ("ratelimit_input_remaining", int),
+    "anthropic-ratelimit-input-tokens-reset": ("ratelimit_input_reset", str),
+}
 
 # 扫描模型列表 (按优先级)
-SCAN_MODELS = [
+SCAN_MODELS: Final[tuple[str, ...]] = (
     "claude-opus-4-6-thinking",
     "claude-opus-4-6-20250918",
     "claude-sonnet-4-5-20250929",
     "claude-haiku-4-5-20251001",
     "claude-3-5-sonnet-20241022",
     "claude-3-haiku-20240307",
-]
+)
 
 # 自动选模型用 (排除 opus 以节省额度)
 PROBE_MODELS = [
@@ -74,6 +110,154 @@ PROBE_MODELS = [
     "claude-3-haiku-20240307",
 ]
 
+# 每个 host 保留的 keep-alive 连接数; 同时在途的请求超过它时,
+# 多出的连接用完即被丢弃, 后续请求又要重新握手
+HTTP_POOL_SIZE = 32
+
+# 并发探测线程上限 (I/O 密集, 线程足够; 不超过连接池)
+MAX_WORKERS = min(16, HTTP_POOL_SIZE)
+
+# Retry-After 最多等待的秒数: 值由上游给出, 异常或恶意中转可能填一整天
+RETRY_AFTER_MAX = 2.0
+
+# 提前判定阈值: 部分探测已含铁证且置信度达到时跳过剩余探测 (尤其是最慢的 thinking 轮)
+EARLY_EXIT_CONFIDENCE = 0.8
+
+# ratelimit 动态验证: 默认 shots 数, shot 间隔, 每个 simple 请求预计消耗的 input tokens
+RL_SHOTS = 4
+RL_SHOT_INTERVAL = 0.3
+RL_SHOT_INPUT_TOKENS = 20
+# ratelimit 动态验证的节流等待总时长上限 (秒, 不含请求本身耗时):
+# reset 时间由上游给出, 伪造方可以任意填写
+RL_VERIFY_BUDGET = 5.0
+
+
+# ── HTTP 会话 ─────────────────────────────────────────────
+
+# 所有探测共用一个 Session, 复用 keep-alive 连接, 避免每次请求重新 TCP+TLS 握手
+# 不保存 cookie: 中转返回的 sticky cookie (CF __cf_bm / ALB) 会把后续探测
+# 钉在同一后端, 掩盖混合渠道; 与原先无状态的 requests.post 行为一致
+_SESSION = requests.Session()
+_SESSION.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                                       pool_maxsize=HTTP_POOL_SIZE, max_retries=0))
+_SESSION.mount("http://", HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                                      pool_maxsize=HTTP_POOL_SIZE, max_retries=0))
+
+
+class AdaptiveLimiter:
+    """AIMD 自适应并发上限 (所有线程共享)
+    - 429 / 502-504 / 网络异常: 上限减半, 并遵守 Retry-After (最多 RETRY_AFTER_MAX 秒)
+      simple 请求 (可用性检测 / ratelimit shots) 只认 429: New-API/OneAPI
+      对未开通的模型也返回 503, 不代表上游过载
+    - 累计 clean_window 次顺利 (200 且延迟 <= 1.2x 同类请求最低延迟): 上限 +1
+      最低延迟按请求类型分开记, 否则 simple 请求会把 tool/thinking 的基线压得过低;
+      偏慢的 200 不计数但也不清零, 只有过载信号才清零
+    """
+
+    OVERLOAD_STATUS = (429, 502, 503, 504)
+
+    def __init__(self, limit: int, max_limit: int, clean_window: int = 10):
+        self.limit = limit
+        self.max_limit = max_limit
+        self.clean_window = clean_window
+        self.inflight = 0
+        self.clean = 0
+        self.min_latency_ms: dict[str, int] = {}
+        self.resume_at = 0.0     # Retry-After 截止时间
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.inflight >= self.limit:
+                self._cond.wait()
+            self.inflight += 1
+            wait = self.resume_at - time.time()
+        if wait > 0:
+            time.sleep(wait)
+
+    def release(self, status: int, latency_ms: int, retry_after: float = 0.0,
+                kind: str = ""):
+        if kind == "simple":
+            overload = status == 429
+        else:
+            overload = status == 0 or status in self.OVERLOAD_STATUS
+        with self._cond:
+            self.inflight -= 1
+            if overload:
+                self.limit = max(1, self.limit // 2)
+                self.clean = 0
+                if retry_after > 0:
+                    self.resume_at = max(self.resume_at,
+                                         time.time() + min(retry_after, RETRY_AFTER_MAX))
+            elif status == 200:
+                base = self.min_latency_ms.get(kind)
+                if base is None or latency_ms < base:
+                    base = self.min_latency_ms[kind] = latency_ms
+                if latency_ms <= 1.2 * base:
+                    self.clean += 1
+                    if self.clean >= self.clean_window and self.limit < self.max_limit:
+                        self.limit += 1
+                        self.clean = 0
+            self._cond.notify_all()
+
+
+_LIMITER = AdaptiveLimiter(limit=max(1, MAX_WORKERS // 2), max_limit=MAX_WORKERS)
+
+
+class TokenBucket:
+    """令牌桶节流 (单线程使用): 每秒补充 rate_per_s 个令牌, 最多存 capacity 个"""
+
+    MIN_RATE = 0.2  # 额度见底时最慢 5s 一次, 不无限期挂起
+
+    def __init__(self, rate_per_s: float, capacity: int = 1):
+        self.rate = rate_per_s
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.time()
+
+    def _refill(self):
+        now = time.time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """距下一个令牌可用还需等待的秒数"""
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def acquire(self):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+    def observe(self, remaining_requests: int, reset_after: float, pending: int):
+        """剩余请求数不够发完 pending 次时才收紧速率, 让它们撑到窗口重置"""
+        if reset_after > 0 and remaining_requests < pending:
+            self.rate = max(min(self.rate, remaining_requests / reset_after), self.MIN_RATE)
+
+
+def parse_reset_after(reset: str) -> float:
+    """ratelimit reset 时间戳 (RFC 3339) 距现在的秒数, 无法解析返回 0"""
+    try:
+        ts = datetime.fromisoformat(reset.replace("Z", "+00:00"))
+    except (AttributeError, ValueError):
+        return 0.0
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return max(0.0, (ts - datetime.now(timezone.utc)).total_seconds())
+
+
+def parse_retry_after(value) -> float:
+    """Retry-After 秒数 (HTTP 日期格式不处理, 返回 0)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0.0
+
 
 # ── 数据结构 ─────────────────────────────────────────────
 
@@ -105,8 +289,8 @@ class Fingerprint:
     # header 指纹
     has_aws_headers: bool = False
     has_anthropic_headers: bool = False
-    aws_headers_found: list = field(default_factory=list)
-    anthropic_headers_found: list = field(default_factory=list)
+    aws_headers_found: list = field(default_factory=list)        # [(key, value), ...]
+    anthropic_headers_found: list = field(default_factory=list)  # [(key, value), ...]
     # 中转站指纹
     proxy_platform: str = ""
     proxy_headers: list = field(default_factory=list)
@@ -138,6 +322,13 @@ class DetectResult:
     proxy_platform: str = ""
     ratelimit_dynamic: str = ""  # dynamic / static / unavailable
 
+    def to_report_dict(self, include_raw: bool = False) -> dict:
+        """转为 JSON 报告用 dict; include_raw=False 时剔除原始响应字段"""
+        report = vars(self).copy()
+        report["fingerprints"] = [fingerprint_report(fp, include_raw)
+                                  for fp in self.fingerprints]
+        return report
+
 
 @dataclass
 class ScanResult:
@@ -148,6 +339,31 @@ class ScanResult:
     summary: dict = field(default_factory=dict)         # model -> verdict
     is_mixed: bool = False
 
+    def to_report_dict(self, include_raw: bool = False) -> dict:
+        """转为 JSON 报告用 dict"""
+        return {
+            "base_url": self.base_url,
+            "proxy_platform": self.proxy_platform,
+            "is_mixed": self.is_mixed,
+            "summary": self.summary,
+            "model_results": [r.to_report_dict(include_raw) for r in self.model_results],
+        }
+
+
+# 仅 verbose 时保留的原始响应字段
+RAW_FIELDS = ("raw_headers", "raw_body")
+
+# 内部存 (key, value) 的 header 命中字段, 报告中还原为 "key: value"
+HEADER_FOUND_FIELDS = ("aws_headers_found", "anthropic_headers_found")
+
+
+def fingerprint_report(fp: dict, include_raw: bool = False) -> dict:
+    """指纹 dict -> 报告格式 (字段与旧版 JSON 报告一致)"""
+    report = {k: v for k, v in fp.items() if include_raw or k not in RAW_FIELDS}
+    for k in HEADER_FOUND_FIELDS:
+        report[k] = [f"{hk}: {hv}" for hk, hv in fp[k]]
+    return report
+
 
 # ── 探测 Payload ─────────────────────────────────────────
 
@@ -170,11 +386,13 @@ def build_tool_payload(model: str) -> dict:
 
 
 def build_thinking_payload(model: str) -> dict:
+    # 只需要 thinking 块的 signature: max_tokens 仅略高于 budget_tokens (API 要求 >),
+    # 提示词尽量短, 减少无用输出 token
     return {
         "model": model,
-        "max_tokens": 2048,
+        "max_tokens": 1100,
         "thinking": {"type": "enabled", "budget_tokens": 1024},
-        "messages": [{"role": "user", "content": "What is 2+3?"}],
+        "messages": [{"role": "user", "content": "Say OK"}],
     }
 
 
@@ -186,6 +404,18 @@ def build_simple_payload(model: str) -> dict:
     }
 
 
+@functools.lru_cache(maxsize=64)
+def encode_payload(probe_type: str, model: str) -> bytes:
+    """序列化探测 payload, 按 (probe_type, model) 缓存, 多轮探测不重复 dumps"""
+    if probe_type == "tool":
+        payload = build_tool_payload(model)
+    elif probe_type == "thinking":
+        payload = build_thinking_payload(model)
+    else:
+        payload = build_simple_payload(model)
+    return json_dumps(payload)
+
+
 # ── 辅助分析 ─────────────────────────────────────────────
 
 def classify_msg_id(msg_id: str) -> tuple[str, str]:
@@ -203,17 +433,15 @@ def classify_msg_id(msg_id: str) -> tuple[str, str]:
         return "vertex", "req_vrtx"
 
     if msg_id.startswith(ANTHROPIC_MSG_PREFIX):
-        if MSG_ID_UUID_PATTERN.match(msg_id):
+        # msg_ 之后前两段 UUID 的连字符位置 (Antigravity 可能截断, 只看前两段)
+        tail = msg_id[len(ANTHROPIC_MSG_PREFIX):]
+        if len(tail) > 13 and tail[8] == "-" and tail[13] == "-":
             return "antigravity", "msg_uuid"
         else:
             return "anthropic", "base62"
     else:
         # 检查是否是纯 UUID
-        uuid_pat = re.compile(
-            r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$",
-            re.IGNORECASE,
-        )
-        if uuid_pat.match(msg_id):
+        if len(msg_id) == 36 and all(msg_id[i] == "-" for i in UUID_DASH_POSITIONS):
             return "rewritten", "uuid"
         return "rewritten", "other"
 
@@ -229,13 +457,20 @@ def classify_thinking_sig(sig: str) -> str:
     return "normal"
 
 
-def detect_proxy_platform(headers: dict) -> tuple[str, list]:
-    """从响应 header 中识别中转平台"""
-    h = {k.lower(): v for k, v in headers.items()}
+def detect_proxy_platform(h: dict) -> tuple[str, list]:
+    """从响应 header 中识别中转平台 (h 的 key 已小写)"""
     platform = ""
     clues = []
 
-    if any("aidistri" in k for k in h):
+    # 所有 key / value 各拼成一个串, 一次 C 层扫描收集平台特征
+    # (用换行分隔, 关键词不含换行, 不会跨 header 误匹配)
+    key_blob = "\n".join(h)
+    val_blob = "\n".join(str(v) for v in h.values())
+    hits = {m.lastgroup for m in PROXY_PLATFORM_KEY_RE.finditer(key_blob)}
+    if "openrouter" in val_blob:
+        hits.add("openrouter")
+
+    if "aidistri" in hits:
         platform = "Aidistri"
         clues.append("X-Aidistri-Request-Id")
 
@@ -247,11 +482,11 @@ def detect_proxy_platform(headers: dict) -> tuple[str, list]:
                         if "accounthub" in x.lower() or "pool" in x.lower()]
         clues.extend(pool_headers[:5])
 
-    if any("openrouter" in k or "openrouter" in str(h.get(k, "")) for k in h):
+    if "openrouter" in hits:
         platform = "OpenRouter"
         clues.append("OpenRouter header detected")
 
-    if any("one-api" in k or "new-api" in k for k in h):
+    if "oneapi" in hits:
         platform = "OneAPI/NewAPI"
         clues.append("OneAPI header detected")
 
@@ -261,67 +496,92 @@ def detect_proxy_platform(headers: dict) -> tuple[str, list]:
     return platform, clues
 
 
+# 中转平台是网关属性而非单次探测属性: base_url -> (platform, clues), 每个站点只识别一次
+_PROXY_PLATFORM_CACHE: dict[str, tuple[str, list]] = {}
+
+
 # ── 探测主函数 ────────────────────────────────────────────
 
-def probe_once(base_url: str, api_key: str, model: str,
-               probe_type: str = "tool", verbose: bool = False) -> Fingerprint:
-    """发送一次探测请求，提取指纹"""
-    fp = Fingerprint()
-    fp.probe_type = probe_type
-    fp.model_requested = model
+def post_messages(base_url: str, api_key: str, data: bytes,
+                  timeout: int, kind: str = "") -> tuple[requests.Response, int]:
+    """POST /v1/messages, 受 _LIMITER 自适应并发控制; 返回 (响应, 延迟 ms)
+    kind 为探测类型 (simple / tool / thinking), 供限流器区分退避规则和延迟基线
+    网络异常原样抛出 (requests.exceptions.RequestException)
+    """
     headers = {
         "Content-Type": "application/json",
         "anthropic-version": "2023-06-01",
         "x-api-key": api_key,
         "Authorization": f"Bearer {api_key}",
     }
+    _LIMITER.acquire()
+    status, latency_ms, retry_after = 0, 0, 0.0
+    try:
+        # 计时不含排队等待, latency_ms 仍是纯网络延迟指纹
+        t0 = time.time()
+        resp = _SESSION.post(f"{base_url}/v1/messages", headers=headers,
+                             data=data, timeout=timeout)
+        latency_ms = int((time.time() - t0) * 1000)
+        status = resp.status_code
+        retry_after = parse_retry_after(resp.headers.get("retry-after"))
+        return resp, latency_ms
+    finally:
+        _LIMITER.release(status, latency_ms, retry_after, kind)
 
-    if probe_type == "tool":
-        payload = build_tool_payload(model)
-    elif probe_type == "thinking":
-        payload = build_thinking_payload(model)
-    else:
-        payload = build_simple_payload(model)
 
-    url = f"{base_url}/v1/messages"
+def probe_once(base_url: str, api_key: str, model: str,
+               probe_type: str = "tool", verbose: bool = False) -> Fingerprint:
+    """发送一次探测请求，提取指纹"""
+    fp = Fingerprint()
+    fp.probe_type = probe_type
+    fp.model_requested = model
 
-    t0 = time.time()
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=60)
+        resp, fp.latency_ms = post_messages(
+            base_url, api_key, encode_payload(probe_type, model), timeout=60,
+            kind=probe_type)
     except requests.exceptions.RequestException as e:
         fp.error = str(e)
         return fp
-    fp.latency_ms = int((time.time() - t0) * 1000)
 
     if resp.status_code != 200:
         fp.error = f"HTTP {resp.status_code}: {resp.text[:200]}"
         return fp
 
-    # ── Headers ──
-    fp.raw_headers = dict(resp.headers)
-    for k, v in resp.headers.items():
+    # ── Headers ── (只遍历一次 CaseInsensitiveDict, 每个 key 只小写一次)
+    items = list(resp.headers.items())
+    if verbose:
+        fp.raw_headers = dict(items)
+    lower_headers = {}
+    for k, v in items:
         kl = k.lower()
-        if any(kw in kl for kw in AWS_HEADER_KEYWORDS):
+        lower_headers[kl] = v
+        if AWS_HEADER_RE.search(kl):
             fp.has_aws_headers = True
-            fp.aws_headers_found.append(f"{k}: {v}")
-        if any(kw in kl for kw in ANTHROPIC_HEADER_KEYWORDS):
+            fp.aws_headers_found.append((k, v))
+        if ANTHROPIC_HEADER_RE.search(kl):
             fp.has_anthropic_headers = True
-            fp.anthropic_headers_found.append(f"{k}: {v}")
-        # 提取 ratelimit 数值
-        if kl == "anthropic-ratelimit-input-tokens-limit":
-            try: fp.ratelimit_input_limit = int(v)
-            except: pass
-        elif kl == "anthropic-ratelimit-input-tokens-remaining":
-            try: fp.ratelimit_input_remaining = int(v)
-            except: pass
-        elif kl == "anthropic-ratelimit-input-tokens-reset":
-            fp.ratelimit_input_reset = v
-
-    fp.proxy_platform, fp.proxy_headers = detect_proxy_platform(resp.headers)
-
-    # ── Body ──
+            fp.anthropic_headers_found.append((k, v))
+
+    # 提取 ratelimit 数值 (查已小写的普通 dict, 省去 CaseInsensitiveDict 每次查找的 lower())
+    for name, (attr, conv) in RATELIMIT_HEADER_FIELDS.items():
+        v = lower_headers.get(name)
+        if v is None:
+            continue
+        try:
+            setattr(fp, attr, conv(v))
+        except ValueError:
+            pass
+
+    platform_info = _PROXY_PLATFORM_CACHE.get(base_url)
+    if platform_info is None:
+        platform_info = detect_proxy_platform(lower_headers)
+        _PROXY_PLATFORM_CACHE[base_url] = platform_info
+    fp.proxy_platform, fp.proxy_headers = platform_info[0], list(platform_info[1])
+
+    # ── Body ── (直接解析原始字节, 省去 resp.text 解码出的整份字符串副本)
     try:
-        body = resp.json()
+        body = json_loads(resp.content)
     except ValueError:
         fp.error = "响应体非 JSON"
         return fp
@@ -329,29 +589,29 @@ def probe_once(base_url: str, api_key: str, model: str,
     if verbose:
         fp.raw_body = body
 
-    # 1) tool_use id
+    # 1) tool_use id + 2) thinking signature (单次遍历 content, 各取第一个)
+    seen_tool = False
     for block in body.get("content", []):
-        if block.get("type") == "tool_use":
+        btype = block.get("type")
+        if btype == "tool_use" and not seen_tool:
+            seen_tool = True
             fp.tool_id = block.get("id", "")
             if fp.tool_id.startswith(BEDROCK_TOOL_PREFIX):
                 fp.tool_id_source = "bedrock"
             elif fp.tool_id.startswith(ANTHROPIC_TOOL_PREFIX):
                 fp.tool_id_source = "anthropic"
-            elif re.match(r"^tool_\d+$", fp.tool_id):
+            elif TOOL_N_PATTERN.match(fp.tool_id):
                 fp.tool_id_source = "vertex"  # Google Vertex AI 简化 ID
             else:
                 fp.tool_id_source = "rewritten"
-            break
-
-    # 2) thinking signature
-    for block in body.get("content", []):
-        if block.get("type") == "thinking":
+        elif btype == "thinking" and not fp.thinking_supported:
             fp.thinking_supported = True
             sig = block.get("signature", "")
             fp.thinking_signature = sig
             fp.thinking_sig_len = len(sig)
             fp.thinking_sig_prefix = sig[:24] if sig else ""
             fp.thinking_sig_class = classify_thinking_sig(sig)
+        if seen_tool and fp.thinking_supported:
             break
 
     # 3) message id (区分 Anthropic 原生 / Antigravity 伪造 / 纯改写)
@@ -413,19 +673,47 @@ def analyze(fingerprints: list[Fingerprint], base_url: str,
         result.proxy_platform = platforms[0]
         evidence.append(f"中转平台: {result.proxy_platform}")
 
+    # ── 打分: 先按字段计数汇总 (与证据文本生成解耦) ──
+    tool_sources = [fp.tool_id_source for fp in valid_fps]
+    msg_sources = [fp.msg_id_source for fp in valid_fps]
+    model_sources = [fp.model_source for fp in valid_fps]
+    sig_classes = [fp.thinking_sig_class for fp in valid_fps if fp.thinking_supported]
+
+    def count(attr: str) -> int:
+        return sum(1 for fp in valid_fps if getattr(fp, attr))
+
+    scores["anthropic"] += (
+        5 * tool_sources.count("anthropic")       # 1. toolu_
+        + 2 * msg_sources.count("anthropic")      # 3. msg_<base62>
+        + 3 * count("has_service_tier")           # 5. Anthropic 独有
+        + 2 * count("has_inference_geo")
+        + 1 * count("has_cache_creation_obj")
+        + 2 * count("has_anthropic_headers")      # 8. rate-limit headers
+    )
+    scores["bedrock"] += (
+        5 * tool_sources.count("bedrock")         # 1. tooluse_ (可能是 AG, 见二次修正)
+        + 8 * model_sources.count("kiro")         # 4. kiro-* 铁证
+        + 3 * model_sources.count("bedrock")      # 4. anthropic.*
+        + 2 * sum(1 for fp in valid_fps if fp.usage_style == "camelCase")  # 6.
+        + 3 * count("has_aws_headers")            # 7. AWS headers
+    )
+    scores["antigravity"] += (
+        5 * tool_sources.count("vertex")          # 1. tool_N
+        + 5 * sig_classes.count("vertex")         # 2. claude# 签名
+        + 6 * msg_sources.count("vertex")         # 3. req_vrtx_
+    )
+
+    # ── 逐轮证据 ──
     for i, fp in enumerate(valid_fps):
         tag = f"[R{i+1}]"
 
-        # ── 1. tool_use id (权重 5) ──
+        # ── 1. tool_use id ──
         if fp.tool_id_source == "bedrock":
             # tooluse_ 可能是 Bedrock/Kiro 或 Antigravity，先暂记 bedrock
-            scores["bedrock"] += 5
             evidence.append(f"{tag} tool_use id: {fp.tool_id[:28]}  -> tooluse_ (Bedrock/AG)")
         elif fp.tool_id_source == "anthropic":
-            scores["anthropic"] += 5
             evidence.append(f"{tag} tool_use id: {fp.tool_id[:28]}  -> toolu_ (Anthropic)")
         elif fp.tool_id_source == "vertex":
-            scores["antigravity"] += 5
             evidence.append(f"{tag} tool_use id: {fp.tool_id[:28]}  -> tool_N (Vertex AI)")
         elif fp.tool_id and fp.tool_id_source == "rewritten":
             evidence.append(f"{tag} tool_use id: {fp.tool_id[:28]}  -> 被改写")
@@ -438,7 +726,6 @@ def analyze(fingerprints: list[Fingerprint], base_url: str,
                     f"{tag} thinking sig: {fp.thinking_sig_prefix}... "
                     f"(len={fp.thinking_sig_len}) -> 签名截断")
             elif fp.thinking_sig_class == "vertex":
-                scores["antigravity"] += 5
                 evidence.append(
                     f"{tag} thinking sig: {fp.thinking_sig_prefix}... "
                     f"(len={fp.thinking_sig_len}) -> claude# 前缀 (Vertex AI)")
@@ -451,65 +738,49 @@ def analyze(fingerprints: list[Fingerprint], base_url: str,
 
         # ── 3. message id ──
         if fp.msg_id_source == "anthropic":
-            scores["anthropic"] += 2
             evidence.append(f"{tag} message id:  {fp.msg_id[:28]}  -> msg_<base62> (Anthropic)")
         elif fp.msg_id_source == "antigravity":
             # msg_<UUID> 可能是 Antigravity 伪造 或 Kiro 中转改写，先暂记
             evidence.append(f"{tag} message id:  {fp.msg_id[:28]}  -> msg_<UUID> (非原生)")
         elif fp.msg_id_source == "vertex":
-            scores["antigravity"] += 6
             evidence.append(f"{tag} message id:  {fp.msg_id[:28]}  -> req_vrtx_ (Vertex AI)")
         elif fp.msg_id_source == "rewritten":
             evidence.append(f"{tag} message id:  {fp.msg_id[:28]}  -> 被改写")
 
         # ── 4. model 格式 (关键区分 Kiro vs Antigravity) ──
         if fp.model_source == "kiro":
-            scores["bedrock"] += 8
             evidence.append(f"{tag} model:       {fp.model}  -> kiro-* (Kiro 逆向铁证)")
         elif fp.model_source == "bedrock":
-            scores["bedrock"] += 3
             evidence.append(f"{tag} model:       {fp.model}  -> anthropic.* (Bedrock)")
 
         # ── 5. service_tier / inference_geo (Anthropic 独有) ──
         if fp.has_service_tier:
-            scores["anthropic"] += 3
             evidence.append(f"{tag} service_tier: {fp.service_tier}  -> Anthropic 独有")
         if fp.has_inference_geo:
-            scores["anthropic"] += 2
             evidence.append(f"{tag} inference_geo: {fp.inference_geo}  -> Anthropic 独有")
         if fp.has_cache_creation_obj:
-            scores["anthropic"] += 1
             evidence.append(f"{tag} cache_creation: 嵌套对象  -> Anthropic 新格式")
 
         # ── 6. usage 风格 ──
         if fp.usage_style == "camelCase":
-            scores["bedrock"] += 2
             evidence.append(f"{tag} usage:       camelCase (Bedrock)")
 
         # ── 7. AWS headers ──
         if fp.has_aws_headers:
-            scores["bedrock"] += 3
-            evidence.append(f"{tag} AWS headers: {', '.join(fp.aws_headers_found[:3])}")
+            hdrs = ", ".join(f"{k}: {v}" for k, v in fp.aws_headers_found[:3])
+            evidence.append(f"{tag} AWS headers: {hdrs}")
 
         # ── 8. Anthropic rate-limit headers ──
         if fp.has_anthropic_headers:
-            scores["anthropic"] += 2
-            evidence.append(f"{tag} Anthropic headers: {', '.join(fp.anthropic_headers_found[:3])}")
+            hdrs = ", ".join(f"{k}: {v}" for k, v in fp.anthropic_headers_found[:3])
+            evidence.append(f"{tag} Anthropic headers: {hdrs}")
 
     # ── 二次修正: tooluse_ 归属 ──
     # 如果有 Vertex/Antigravity 强信号 且没有 kiro- model，tooluse_ 应归 Antigravity
-    has_kiro_model = any(fp.model_source == "kiro" for fp in valid_fps)
-    has_vertex_signal = any(
-        fp.tool_id_source == "vertex" or fp.msg_id_source == "vertex"
-        or fp.thinking_sig_class == "vertex"
-        for fp in valid_fps
-    )
+    has_kiro_model = "kiro" in model_sources
 
     if not has_kiro_model and scores["antigravity"] > 0 and scores["bedrock"] > 0:
-        tooluse_points = sum(
-            5 for fp in valid_fps
-            if fp.tool_id_source == "bedrock"
-        )
+        tooluse_points = 5 * tool_sources.count("bedrock")
         if scores["antigravity"] >= 4:
             scores["antigravity"] += tooluse_points
             scores["bedrock"] -= tooluse_points
@@ -517,10 +788,7 @@ def analyze(fingerprints: list[Fingerprint], base_url: str,
 
     # 如果有 kiro- model，msg_<UUID> 也应归 Bedrock 而非 Antigravity
     if has_kiro_model:
-        msg_uuid_count = sum(
-            1 for fp in valid_fps
-            if fp.msg_id_source == "antigravity"
-        )
+        msg_uuid_count = msg_sources.count("antigravity")
         if msg_uuid_count > 0:
             evidence.append(f"[修正] msg_<UUID> x{msg_uuid_count} 归属 Kiro 中转改写 (非 Antigravity)")
 
@@ -603,10 +871,29 @@ def analyze(fingerprints: list[Fingerprint], base_url: str,
             "但无法伪造 inference_geo 和 cache_creation 嵌套对象")
 
     result.evidence = evidence
-    result.fingerprints = [asdict(fp) for fp in fingerprints]
+    # Fingerprint 只含内置容器字段, 浅拷贝即可, 免去 asdict 的递归深拷贝
+    result.fingerprints = [vars(fp).copy() for fp in fingerprints]
     return result
 
 
+def is_decisive(fingerprints: list[Fingerprint]) -> bool:
+    """部分指纹是否已足以判定为 Bedrock / Antigravity。
+    只认铁证: kiro-* model -> Bedrock; tool_N / req_vrtx_ -> Antigravity。
+    tooluse_ 两边都可能出现 (靠 thinking 轮 claude# 签名区分), 不作为提前判定依据;
+    Anthropic 判定依赖 thinking 轮的缺失字段校验, 同样不提前结束。
+    """
+    valid_fps = [fp for fp in fingerprints if not fp.error]
+    kiro = any(fp.model_source == "kiro" for fp in valid_fps)
+    vertex = any(fp.tool_id_source == "vertex" or fp.msg_id_source == "vertex"
+                 for fp in valid_fps)
+    if kiro == vertex:
+        # 没有铁证, 或两边铁证互相矛盾
+        return False
+    partial = analyze(fingerprints, "")
+    return (partial.verdict == ("bedrock" if kiro else "antigravity")
+            and partial.confidence > EARLY_EXIT_CONFIDENCE)
+
+
 # ── 输出 ─────────────────────────────────────────────────
 
 VERDICT_MAP = {
@@ -634,6 +921,27 @@ VERDICT_SHORT = {
 }
 
 
+def dumps_report(report: dict) -> bytes:
+    """报告序列化为 UTF-8 JSON (缩进 2, 中文不转义); 有 orjson 时走 C 实现"""
+    if orjson is not None:
+        return orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(report, indent=2, ensure_ascii=False).encode()
+
+
+def build_report(result, include_raw: bool = False) -> dict:
+    """ScanResult / DetectResult -> JSON 报告 dict (单模型报告附带判定说明)"""
+    report = result.to_report_dict(include_raw)
+    if isinstance(result, DetectResult):
+        report["verdict_text"] = VERDICT_MAP.get(result.verdict, result.verdict)
+    return report
+
+
+def write_output(path: str, data: bytes):
+    """写出报告文件 (UTF-8 字节, 原样写入)"""
+    with open(path, "wb") as f:
+        f.write(data)
+
+
 def print_report(result: DetectResult):
     """打印单模型检测报告"""
     v = result.verdict
@@ -774,63 +1082,84 @@ def print_scan_report(scan: ScanResult):
 
 # ── 自动选模型 ────────────────────────────────────────────
 
-def find_working_model(base_url: str, api_key: str) -> str:
-    headers = {
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01",
-        "x-api-key": api_key,
-        "Authorization": f"Bearer {api_key}",
-    }
-    for model in PROBE_MODELS:
-        payload = {
-            "model": model,
-            "max_tokens": 5,
-            "messages": [{"role": "user", "content": "hi"}],
-        }
-        try:
-            resp = requests.post(
-                f"{base_url}/v1/messages", headers=headers,
-                json=payload, timeout=15,
-            )
-            if resp.status_code == 200:
-                return model
-        except requests.exceptions.RequestException:
-            continue
+# 模型可用性缓存: (base_url, api_key 摘要, model) -> bool
+# 供同一进程内重复调用 (批量检测多个中转) 复用, 只缓存确定的结果
+_AVAILABILITY_CACHE: dict[tuple[str, str, str], bool] = {}
+
+
+def find_working_model(base_url: str, api_key: str, use_cache: bool = True) -> str:
+    """并发探测 PROBE_MODELS, 按优先级返回第一个可用模型"""
+    ex = concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(len(PROBE_MODELS), MAX_WORKERS))
+    try:
+        futs = {ex.submit(check_model_available, base_url, api_key, m, 15, use_cache): m
+                for m in PROBE_MODELS}
+        ok = {}
+        for fut in concurrent.futures.as_completed(futs):
+            ok[futs[fut]] = fut.result()
+            # 更高优先级的模型都有结果后即可提前返回, 不等待其余请求
+            for model in PROBE_MODELS:
+                if model not in ok:
+                    break
+                if ok[model]:
+                    return model
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
     return PROBE_MODELS[0]
 
 
-def check_model_available(base_url: str, api_key: str, model: str) -> bool:
-    """快速检查模型是否可用"""
-    headers = {
-        "Content-Type": "application/json",
-        "anthropic-version": "2023-06-01",
-        "x-api-key": api_key,
-        "Authorization": f"Bearer {api_key}",
-    }
-    payload = {
-        "model": model,
-        "max_tokens": 5,
-        "messages": [{"role": "user", "content": "hi"}],
-    }
+def check_model_available(base_url: str, api_key: str, model: str,
+                          timeout: int = 20, use_cache: bool = True) -> bool:
+    """快速检查模型是否可用
+    结果按进程缓存, 但只缓存确定的答复: 200 或模型不存在类的 4xx;
+    429 / 408 / 5xx / 网络异常都是暂时的, 下次重新探测
+    """
+    # 缓存 key 不保存明文 api_key
+    key = (base_url, hashlib.sha256(api_key.encode()).hexdigest()[:16], model)
+    if use_cache and key in _AVAILABILITY_CACHE:
+        return _AVAILABILITY_CACHE[key]
+
     try:
-        resp = requests.post(
-            f"{base_url}/v1/messages", headers=headers,
-            json=payload, timeout=20,
-        )
-        return resp.status_code == 200
+        resp, _ = post_messages(base_url, api_key,
+                                encode_payload("simple", model), timeout=timeout,
+                                kind="simple")
     except requests.exceptions.RequestException:
         return False
+    status = resp.status_code
+    ok = status == 200
+    if use_cache and (ok or (400 <= status < 500 and status not in (408, 429))):
+        _AVAILABILITY_CACHE[key] = ok
+    return ok
+
+
+def rl_shot_budget(remaining: int, shots: int = RL_SHOTS) -> int:
+    """按剩余 input tokens 决定 ratelimit 验证的 shots 数, 额度紧张时少发 (至少 2 次才能比较)"""
+    budget = remaining // RL_SHOT_INPUT_TOKENS
+    if budget < 2 * shots:
+        return max(2, budget // 2)
+    return shots
 
 
 def verify_ratelimit_dynamic(base_url: str, api_key: str, model: str,
-                             shots: int = 4, quiet: bool = False) -> dict:
+                             shots: int = RL_SHOTS, quiet: bool = False) -> dict:
     """连发多次简单请求，检查 ratelimit-remaining 是否真的在递减。
     返回 {"verdict": "dynamic"|"static"|"unavailable",
            "samples": [(remaining, reset_ts), ...],
            "detail": str}
     """
     samples = []
+    # 令牌桶控制发送节奏, 额度不够发完剩余 shots 时才收紧;
+    # 只限制节流等待的累计时长, 慢中转的请求耗时不计入
+    bucket = TokenBucket(1 / RL_SHOT_INTERVAL)
+    waited = 0.0
     for i in range(shots):
+        wait = bucket.wait_time()
+        if waited + wait > RL_VERIFY_BUDGET:
+            if not quiet:
+                print(f"      节流等待超出上限, 剩余 {shots - i} shots 跳过")
+            break
+        waited += wait
+        bucket.acquire()
         fp = probe_once(base_url, api_key, model, "simple")
         if fp.error:
             if not quiet:
@@ -841,29 +1170,31 @@ def verify_ratelimit_dynamic(base_url: str, api_key: str, model: str,
         samples.append((r, t))
         if not quiet:
             print(f"      shot {i+1}: remaining={r}  reset={t}  ({fp.latency_ms}ms)")
-        time.sleep(0.3)
+        bucket.observe(r // RL_SHOT_INPUT_TOKENS, parse_reset_after(t), shots - i - 1)
 
     if len(samples) < 2:
         return {"verdict": "unavailable", "samples": samples,
                 "detail": "有效样本不足"}
 
     remainings = [s[0] for s in samples]
-    resets = [s[1] for s in samples]
 
-    # 检查 remaining 是否全部相同
-    all_same = len(set(remainings)) == 1
-    # 检查是否单调递减（允许相等，因为可能同一秒内）
-    monotone_dec = all(remainings[i] >= remainings[i+1]
-                       for i in range(len(remainings)-1))
+    # 单次遍历: remaining 是否全部相同 / 是否单调递减（允许相等，因为可能同一秒内）
+    first = prev = remainings[0]
+    all_same = True
+    monotone_dec = True
+    for x in remainings[1:]:
+        all_same = all_same and x == first
+        monotone_dec = monotone_dec and x <= prev
+        prev = x
     # 检查递减量是否合理（每次请求消耗几十到几百 tokens）
-    total_drop = remainings[0] - remainings[-1]
+    total_drop = first - prev
 
     if all_same:
         return {"verdict": "static", "samples": samples,
-                "detail": f"remaining 固定为 {remainings[0]}，未随请求变化 → 伪造"}
+                "detail": f"remaining 固定为 {first}，未随请求变化 → 伪造"}
     elif monotone_dec and total_drop > 0:
         return {"verdict": "dynamic", "samples": samples,
-                "detail": f"remaining 递减 {remainings[0]}→{remainings[-1]} "
+                "detail": f"remaining 递减 {first}→{prev} "
                           f"(消耗 {total_drop}) → 真实"}
     else:
         # 非单调但有变化 — 可能是多 key 轮询或窗口重置
@@ -873,62 +1204,86 @@ def verify_ratelimit_dynamic(base_url: str, api_key: str, model: str,
 
 # ── 单模型检测流程 ────────────────────────────────────────
 
+def format_probe_result(fp: Fingerprint) -> str:
+    """单次探测的进度行结果部分"""
+    if fp.error:
+        return f"x  {fp.error[:50]}"
+    if fp.probe_type == "thinking":
+        extra = ""
+        if fp.thinking_sig_class:
+            extra = f" | sig={fp.thinking_sig_class}({fp.thinking_sig_len})"
+        if fp.has_service_tier:
+            extra += f" | svc={fp.service_tier}"
+        return (f"ok {fp.latency_ms}ms "
+                f"| msg={fp.msg_id_source}({fp.msg_id_format}){extra}")
+    return (f"ok {fp.latency_ms}ms "
+            f"| tool={fp.tool_id_source} "
+            f"| msg={fp.msg_id_source}({fp.msg_id_format})")
+
+
 def detect_single_model(base_url: str, api_key: str, model: str,
                         rounds: int = 2, verbose: bool = False,
-                        quiet: bool = False) -> DetectResult:
-    """对单个模型执行检测"""
+                        quiet: bool = False, parallel: bool = False) -> DetectResult:
+    """对单个模型执行检测 (parallel=True 时各轮探测并发发出)"""
+    probe_types = ["tool"] * rounds + ["thinking"]
+    total = len(probe_types)
     fingerprints: list[Fingerprint] = []
+    early_exit = False
+
+    if parallel:
+        # 全部提交后按完成顺序收集; 结果按原轮次排列, 证据编号不变
+        # 各轮同时在途, 没有可跳过的探测, 因此并发模式不做提前判定
+        slots: list = [None] * total
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(total, MAX_WORKERS)) as ex:
+            futs = {ex.submit(probe_once, base_url, api_key, model, pt, verbose): i
+                    for i, pt in enumerate(probe_types)}
+            for fut in concurrent.futures.as_completed(futs):
+                i = futs[fut]
+                slots[i] = fut.result()
+                if not quiet:
+                    label = f"[{probe_types[i]}]"
+                    print(f"    [{i+1}/{total}] {label:<10} {format_probe_result(slots[i])}")
+        fingerprints = slots
+    else:
+        for i, pt in enumerate(probe_types):
+            if not quiet:
+                label = f"[{pt}]"
+                print(f"    [{i+1}/{total}] {label:<10} ", end="", flush=True)
 
-    # tool 探测
-    for i in range(rounds):
-        if not quiet:
-            print(f"    [{i+1}/{rounds+1}] [tool]     ", end="", flush=True)
-
-        fp = probe_once(base_url, api_key, model, "tool", verbose)
-        fingerprints.append(fp)
-
-        if not quiet:
-            if fp.error:
-                print(f"x  {fp.error[:50]}")
-            else:
-                print(f"ok {fp.latency_ms}ms "
-                      f"| tool={fp.tool_id_source} "
-                      f"| msg={fp.msg_id_source}({fp.msg_id_format})")
+            fp = probe_once(base_url, api_key, model, pt, verbose)
+            fingerprints.append(fp)
 
-        if i < rounds - 1:
-            time.sleep(0.3)
+            if not quiet:
+                print(format_probe_result(fp))
 
-    # thinking 探测
-    if not quiet:
-        print(f"    [{rounds+1}/{rounds+1}] [thinking] ", end="", flush=True)
+            # 剩余探测 (尤其最慢的 thinking 轮) 已无必要时跳过
+            if i < total - 1 and is_decisive(fingerprints):
+                early_exit = True
+                break
 
-    fp = probe_once(base_url, api_key, model, "thinking", verbose)
-    fingerprints.append(fp)
+            if i < rounds - 1:
+                time.sleep(0.3)
 
-    if not quiet:
-        if fp.error:
-            print(f"x  {fp.error[:50]}")
-        else:
-            extra = ""
-            if fp.thinking_sig_class:
-                extra = f" | sig={fp.thinking_sig_class}({fp.thinking_sig_len})"
-            if fp.has_service_tier:
-                extra += f" | svc={fp.service_tier}"
-            print(f"ok {fp.latency_ms}ms "
-                  f"| msg={fp.msg_id_source}({fp.msg_id_format}){extra}")
+    if early_exit and not quiet:
+        print(f"    [--] 已足以判定, 跳过剩余探测")
 
     # ratelimit 动态验证 (仅当检测到 ratelimit headers 时)
-    has_rl = any(fp.ratelimit_input_remaining > 0 for fp in fingerprints if not fp.error)
+    rl_remainings = [fp.ratelimit_input_remaining for fp in fingerprints
+                     if not fp.error and fp.ratelimit_input_remaining > 0]
     rl_result = None
-    if has_rl:
+    if rl_remainings:
+        shots = rl_shot_budget(min(rl_remainings))
         if not quiet:
-            print(f"    [RL] ratelimit 动态验证 (4 shots)...")
-        rl_result = verify_ratelimit_dynamic(base_url, api_key, model, shots=4, quiet=quiet)
+            print(f"    [RL] ratelimit 动态验证 ({shots} shots)...")
+        rl_result = verify_ratelimit_dynamic(base_url, api_key, model, shots=shots, quiet=quiet)
         if not quiet:
             print(f"    [RL] 结论: {rl_result['detail']}")
             print()
 
     result = analyze(fingerprints, base_url, model)
+    if early_exit:
+        result.evidence.append("[提前判定] 部分探测已足以判定, 跳过剩余探测")
 
     # 将 ratelimit 验证结果注入
     if rl_result:
@@ -950,12 +1305,20 @@ def detect_single_model(base_url: str, api_key: str, model: str,
 # ── 多模型扫描 ───────────────────────────────────────────
 
 def scan_all_models(base_url: str, api_key: str,
-                    models: list[str] = None,
+                    models: Optional[Sequence[str]] = None,
                     rounds: int = 1, verbose: bool = False,
-                    quiet: bool = False) -> ScanResult:
-    """扫描多个模型，检测每个模型的后端来源"""
+                    quiet: bool = False, parallel: bool = False,
+                    parallel_models: int = 4,
+                    use_cache: bool = True) -> ScanResult:
+    """扫描多个模型，检测每个模型的后端来源
+    parallel=True 时最多 parallel_models 个模型同时检测, 每个模型内各轮探测也并发
+    """
     if models is None:
+        # 默认列表本身无重复且不可变, 直接使用, 不再复制
         models = SCAN_MODELS
+    else:
+        # 去重 (保持顺序), 重复模型不重复探测
+        models = tuple(dict.fromkeys(models))
 
     scan = ScanResult(base_url=base_url)
 
@@ -964,18 +1327,22 @@ def scan_all_models(base_url: str, api_key: str,
         print(f"  [*] 开始多模型扫描 ({len(models)} 个模型)...")
         print()
 
-    # 先检测可用性
+    # 先并发检测可用性 (全部提交后再收集, 按原顺序输出)
+    # 这一步建立的连接都会回到 _SESSION 连接池, 随后的探测直接复用, 不再握手
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(len(models), MAX_WORKERS))) as ex:
+        futs = [ex.submit(check_model_available, base_url, api_key, m,
+                          use_cache=use_cache)
+                for m in models]
+        availability = [f.result() for f in futs]
+
     available_models = []
-    for model in models:
+    for model, ok in zip(models, availability):
         if not quiet:
-            print(f"  [?] 检测 {model}...", end=" ", flush=True)
-        if check_model_available(base_url, api_key, model):
+            print(f"  [?] 检测 {model}...", "可用" if ok else "不可用")
+        if ok:
             available_models.append(model)
-            if not quiet:
-                print("可用")
         else:
-            if not quiet:
-                print("不可用")
             # 添加不可用记录
             r = DetectResult(model=model, verdict="unavailable", base_url=base_url)
             scan.model_results.append(r)
@@ -987,25 +1354,51 @@ def scan_all_models(base_url: str, api_key: str,
         print()
 
     # 对每个可用模型进行检测
-    for model in available_models:
+    if parallel and available_models:
+        # 模型间互相独立: 线程池大小即并发上限, 避免压垮上游限流;
+        # 同时在途请求 (模型数 x 每模型探测数) 不超过连接池, 保证连接全部复用
+        parallel_models = min(parallel_models,
+                              max(1, HTTP_POOL_SIZE // (rounds + 1)))
+        # 并发时逐轮进度会交错, 只在每个模型完成时输出一行结论
+        # 结果按下标写入预分配列表, 完成顺序不影响输出顺序
+        results: list[Optional[DetectResult]] = [None] * len(available_models)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(len(available_models), parallel_models)) as ex:
+            futs = {ex.submit(detect_single_model, base_url, api_key, m,
+                              rounds=rounds, verbose=verbose, quiet=True,
+                              parallel=True): idx
+                    for idx, m in enumerate(available_models)}
+            for fut in concurrent.futures.as_completed(futs):
+                result = results[futs[fut]] = fut.result()
+                if not quiet:
+                    v = result.verdict
+                    print(f"  == {result.model} -> {VERDICT_ICON.get(v, '?')} "
+                          f"{VERDICT_SHORT.get(v, v)} "
+                          f"(置信度 {result.confidence:.0%})")
         if not quiet:
-            print(f"  == 检测 {model} ==")
+            print()
+        scan.model_results.extend(r for r in results if r is not None)
+        scan.summary.update((r.model, r.verdict) for r in results if r is not None)
+    else:
+        for model in available_models:
+            if not quiet:
+                print(f"  == 检测 {model} ==")
 
-        result = detect_single_model(
-            base_url, api_key, model,
-            rounds=rounds, verbose=verbose, quiet=quiet,
-        )
-        scan.model_results.append(result)
-        scan.summary[model] = result.verdict
+            result = detect_single_model(
+                base_url, api_key, model,
+                rounds=rounds, verbose=verbose, quiet=quiet,
+            )
+            scan.model_results.append(result)
+            scan.summary[model] = result.verdict
 
-        if not quiet:
-            v = result.verdict
-            print(f"    -> {VERDICT_ICON.get(v, '?')} {VERDICT_SHORT.get(v, v)} "
-                  f"(置信度 {result.confidence:.0%})")
-            print()
+            if not quiet:
+                v = result.verdict
+                print(f"    -> {VERDICT_ICON.get(v, '?')} {VERDICT_SHORT.get(v, v)} "
+                      f"(置信度 {result.confidence:.0%})")
+                print()
 
-        # 模型间隔
-        time.sleep(0.5)
+            # 模型间隔
+            time.sleep(0.5)
 
     # 判断是否混合渠道
     verdicts = set(v for v in scan.summary.values() if v != "unavailable")
@@ -1047,7 +1440,9 @@ def main():
     parser.add_argument("--rounds", type=int, default=2,
                         help="每个模型的 tool 探测轮次 (默认: 2)")
     parser.add_argument("--parallel", action="store_true",
-                        help="并行发送探测请求")
+                        help="并行探测: 每个模型的各轮探测并发, 扫描时多个模型并发")
+    parser.add_argument("--parallel-models", type=int, default=4,
+                        help="--parallel 扫描时同时检测的模型数上限 (默认: 4)")
     parser.add_argument("--json", action="store_true",
                         help="JSON 格式输出")
     parser.add_argument("--verbose", action="store_true",
@@ -1083,97 +1478,53 @@ def main():
         if args.scan_models:
             models = [m.strip() for m in args.scan_models.split(",") if m.strip()]
 
-        scan = scan_all_models(
+        result = scan_all_models(
             base_url, api_key,
             models=models,
             rounds=args.rounds,
             verbose=args.verbose,
             quiet=quiet,
+            parallel=args.parallel,
+            parallel_models=max(1, args.parallel_models),
         )
 
-        if args.json:
-            report = {
-                "base_url": scan.base_url,
-                "proxy_platform": scan.proxy_platform,
-                "is_mixed": scan.is_mixed,
-                "summary": scan.summary,
-                "model_results": [asdict(r) for r in scan.model_results],
-            }
-            if not args.verbose:
-                for mr in report["model_results"]:
-                    for fp in mr.get("fingerprints", []):
-                        fp.pop("raw_headers", None)
-                        fp.pop("raw_body", None)
-            out = json.dumps(report, indent=2, ensure_ascii=False)
-            if args.output:
-                with open(args.output, "w") as f:
-                    f.write(out)
-                print(f"已保存: {args.output}", file=sys.stderr)
-            else:
-                print(out)
-        else:
-            print_scan_report(scan)
-            if args.output:
-                report = {
-                    "base_url": scan.base_url,
-                    "proxy_platform": scan.proxy_platform,
-                    "is_mixed": scan.is_mixed,
-                    "summary": scan.summary,
-                    "model_results": [asdict(r) for r in scan.model_results],
-                }
-                if not args.verbose:
-                    for mr in report["model_results"]:
-                        for fp in mr.get("fingerprints", []):
-                            fp.pop("raw_headers", None)
-                            fp.pop("raw_body", None)
-                with open(args.output, "w") as f:
-                    json.dump(report, f, indent=2, ensure_ascii=False)
-                print(f"  JSON 报告已保存: {args.output}")
-        return
-
     # ── 单模型模式 ──
-    model = args.model
-    if not model:
-        if not quiet:
-            print("  [*] 自动选择可用模型...", end=" ", flush=True)
-        model = find_working_model(base_url, api_key)
+    else:
+        model = args.model
+        if not model:
+            if not quiet:
+                print("  [*] 自动选择可用模型...", end=" ", flush=True)
+            model = find_working_model(base_url, api_key)
+            if not quiet:
+                print(f"{model}")
+                print()
+
         if not quiet:
-            print(f"{model}")
+            print(f"  [*] 开始探测 ({args.rounds} 轮 tool + 1 轮 thinking)...")
             print()
 
-    if not quiet:
-        print(f"  [*] 开始探测 ({args.rounds} 轮 tool + 1 轮 thinking)...")
-        print()
-
-    result = detect_single_model(
-        base_url, api_key, model,
-        rounds=args.rounds, verbose=args.verbose, quiet=quiet,
-    )
+        result = detect_single_model(
+            base_url, api_key, model,
+            rounds=args.rounds, verbose=args.verbose, quiet=quiet,
+            parallel=args.parallel,
+        )
 
+    # ── 输出 ──
     if args.json:
-        report = asdict(result)
-        report["verdict_text"] = VERDICT_MAP.get(result.verdict, result.verdict)
-        if not args.verbose:
-            for fp in report["fingerprints"]:
-                fp.pop("raw_headers", None)
-                fp.pop("raw_body", None)
-        out = json.dumps(report, indent=2, ensure_ascii=False)
+        out = dumps_report(build_report(result, include_raw=args.verbose))
         if args.output:
-            with open(args.output, "w") as f:
-                f.write(out)
+            write_output(args.output, out)
             print(f"已保存: {args.output}", file=sys.stderr)
         else:
-            print(out)
+            print(out.decode())
     else:
-        print_report(result)
+        if isinstance(result, ScanResult):
+            print_scan_report(result)
+        else:
+            print_report(result)
         if args.output:
-            report = asdict(result)
-            if not args.verbose:
-                for fp in report["fingerprints"]:
-                    fp.pop("raw_headers", None)
-                    fp.pop("raw_body", None)
-            with open(args.output, "w") as f:
-                json.dump(report, f, indent=2, ensure_ascii=False)
+            report = build_report(result, include_raw=args.verbose)
+            write_output(args.output, dumps_report(report))
             print(f"  JSON 报告已保存: {args.output}")
 
 